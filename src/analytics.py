@@ -0,0 +1,44 @@
+# Grade points used by the GPA report; grades not listed here are left out of the average
+GRADE_POINTS = {"A": 10, "B": 8, "C": 6, "D": 4, "E": 2, "F": 0}
+
+# Row shape of each report. key narrows "distribution" and "counts" to one
+# course-id and "gpa" to one student-ID.
+REPORTS = {
+    "distribution": ("course_id", "grade", "students"),
+    "gpa": ("student_id", "gpa", "courses"),
+    "counts": ("grade", "rows"),
+}
+
+
+def _normalize(report, row):
+    # Drivers return Decimal/float/int differently; every store reports the same types
+    if report == "gpa":
+        student_id, gpa, courses = row
+        return student_id, (round(float(gpa), 2) if gpa is not None else None), int(courses)
+    *group, count = row
+    return (*group, int(count))
+
+
+def stream_report(manager, report, key=None, batch_size=10000):
+    """Run a grade report inside the store and yield its rows in batches.
+
+    Each manager's iter_aggregate() pushes the grouping down (GROUP BY in
+    Postgres and Hive, an aggregation pipeline in Mongo), so only the
+    aggregated rows leave the store. Rows are sorted by their group columns.
+    """
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report {report!r}; expected one of {', '.join(REPORTS)}")
+    return (
+        [_normalize(report, row) for row in batch]
+        for batch in manager.iter_aggregate(report, key, batch_size)
+    )
+
+
+def run_report(manager, report, key=None):
+    return [row for batch in stream_report(manager, report, key) for row in batch]
+
+
+def print_report(store, report, rows):
+    print(f"{store.upper()}: REPORT {report} ({', '.join(REPORTS[report])})")
+    for row in rows:
+        print("  " + ", ".join(str(value) for value in row))
@@ -0,0 +1,254 @@
+import asyncio
+import inspect
+from datetime import datetime
+from oplog_merge import resolve_lww, format_ts
+from shared_lock import SharedLock
+
+# Async counterparts of the grade managers. They work on tables/collections that
+# the blocking managers have already created and loaded; they do not reset them.
+
+
+async def _read_set_oplogs(peer):
+    # Peers can be async managers or the blocking ones, which are run in a thread
+    if inspect.iscoroutinefunction(peer.read_set_oplogs):
+        return await peer.read_set_oplogs()
+    return await asyncio.to_thread(peer.read_set_oplogs)
+
+
+class _shared_apply:
+    # Holds a manager's apply_lock shared; a blocked acquire waits in a thread, not on the event loop
+    def __init__(self, apply_lock):
+        self.apply_lock = apply_lock
+
+    async def __aenter__(self):
+        await asyncio.to_thread(self.apply_lock.acquire_shared)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.apply_lock.release_shared()
+        return False
+
+
+async def _merge_from(target, peers):
+    # Fetch every peer's oplog and our own at the same time, then resolve once
+    results = await asyncio.gather(target.read_set_oplogs(), *(_read_set_oplogs(peer) for peer in peers))
+    local, remote = results[0], [row for rows in results[1:] for row in rows]
+    winners = resolve_lww(remote, local)
+    await target.apply_merged(winners)
+    return len(winners)
+
+
+async def get_all(managers, student_id, course_id):
+    # Read one key from every store at once, as {store_name: grade}
+    grades = await asyncio.gather(*(manager.get(student_id, course_id) for manager in managers))
+    return {manager.store_name: grade for manager, grade in zip(managers, grades)}
+
+
+async def _record_read(read_stats, student_id, course_id):
+    # GETs are counted like in the blocking managers; a due flush writes through
+    # the blocking manager, so it runs in a thread instead of on the event loop
+    if read_stats is not None and read_stats.record(student_id, course_id, flush=False):
+        await asyncio.to_thread(read_stats.flush)
+
+
+class AsyncSQLGradeManager:
+    store_name = "sql"
+
+    def __init__(self, db_url, read_stats=None, apply_lock=None):
+        # Each store's driver is only imported when that store is used
+        from sqlalchemy import Column, String, PrimaryKeyConstraint, Table, MetaData, insert, select, update, bindparam
+        from sqlalchemy.ext.asyncio import create_async_engine
+        # e.g. postgresql+asyncpg://... or sqlite+aiosqlite:///...
+        self.engine = create_async_engine(db_url)
+        # Pass the blocking manager's ReadStatsAggregator to count GETs in its read_stats table,
+        # and its apply_lock so its truncate_acknowledged also waits for these applies
+        self.read_stats = read_stats
+        self.apply_lock = apply_lock or SharedLock()
+        self.metadata = MetaData()
+        self.grades = Table(
+            'grades', self.metadata,
+            Column('student-ID', String, nullable=False),
+            Column('course-id', String, nullable=False),
+            Column('grade', String, nullable=False),
+            PrimaryKeyConstraint('student-ID', 'course-id')
+        )
+        self.oplogs = Table(
+            'oplogs', self.metadata,
+            Column('timestamp', String, nullable=False),
+            Column('operation', String, nullable=False),
+            Column('student-ID', String, nullable=False),
+            Column('course-id', String, nullable=False),
+            Column('new_grade', String, nullable=False),
+        )
+        # Built once and bound per call, like SQLGradeManager's statements
+        key = (
+            (self.grades.c["student-ID"] == bindparam("student_id")) &
+            (self.grades.c["course-id"] == bindparam("course_id"))
+        )
+        self.get_grade_stmt = select(self.grades.c["grade"]).where(key)
+        self.update_grade_stmt = update(self.grades).where(key).values(grade=bindparam("new_grade"))
+        self.insert_grade_stmt = insert(self.grades)
+        self.insert_oplog_stmt = insert(self.oplogs)
+        self.set_oplogs_stmt = select(
+            self.oplogs.c["timestamp"],
+            self.oplogs.c["student-ID"],
+            self.oplogs.c["course-id"],
+            self.oplogs.c["new_grade"]
+        ).where(self.oplogs.c["operation"] == "SET")
+
+    async def get(self, student_id, course_id):
+        async with self.engine.begin() as conn:
+            result = (await conn.execute(self.get_grade_stmt, {
+                "student_id": student_id,
+                "course_id": course_id
+            })).fetchone()
+            if result is None:
+                print(f"There is no combination of student_id {student_id} and course_id {course_id}")
+                return None
+        await _record_read(self.read_stats, student_id, course_id)
+        return result[0]
+
+    async def set(self, student_id, course_id, new_grade):
+        async with self.engine.begin() as conn:
+            result = await conn.execute(self.update_grade_stmt, {
+                "student_id": student_id,
+                "course_id": course_id,
+                "new_grade": new_grade
+            })
+            if result.rowcount == 0:
+                print(f"There is no combination of student_id {student_id} and course_id {course_id}")
+                return
+            await self._log_operation(conn, "SET", student_id, course_id, new_grade)
+
+    async def _log_operation(self, conn, operation, student_id, course_id, new_grade='X', timestamp=None):
+        await conn.execute(self.insert_oplog_stmt, {
+            "timestamp": format_ts(timestamp or datetime.now()),
+            "operation": operation,
+            "student-ID": student_id,
+            "course-id": course_id,
+            "new_grade": str(new_grade)
+        })
+
+    async def read_set_oplogs(self):
+        async with self.engine.connect() as conn:
+            result = await conn.execute(self.set_oplogs_stmt)
+            return [tuple(row) for row in result]
+
+    async def apply_merged(self, winners):
+        async with _shared_apply(self.apply_lock), self.engine.begin() as conn:
+            for (student_id, course_id), (ts, new_grade) in winners.items():
+                result = await conn.execute(self.update_grade_stmt, {
+                    "student_id": student_id,
+                    "course_id": course_id,
+                    "new_grade": new_grade
+                })
+                if result.rowcount == 0:
+                    await conn.execute(self.insert_grade_stmt, {
+                        "student-ID": student_id,
+                        "course-id": course_id,
+                        "grade": new_grade
+                    })
+                await self._log_operation(conn, "SET", student_id, course_id, new_grade, timestamp=ts)
+
+    async def merge_from(self, *peers):
+        return await _merge_from(self, peers)
+
+    async def close(self):
+        await self.engine.dispose()
+
+
+class AsyncMongoDBGradeManager:
+    store_name = "mongo"
+
+    def __init__(self, client=None, read_stats=None, apply_lock=None):
+        if client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            client = AsyncIOMotorClient()
+        self.client = client
+        self.read_stats = read_stats
+        self.apply_lock = apply_lock or SharedLock()
+        self.db = self.client.new_database
+        self.grades = self.db.grades
+        self.oplogs = self.db.oplogs
+
+    async def get(self, student_id, course_id):
+        doc = await self.grades.find_one({"student-ID": student_id, "course-id": course_id})
+        if doc is None:
+            print(f"There is no combination of student_id {student_id} and course_id {course_id}")
+            return None
+        await _record_read(self.read_stats, student_id, course_id)
+        return doc["grade"]
+
+    async def set(self, student_id, course_id, new_grade):
+        result = await self.grades.update_one(
+            {"student-ID": student_id, "course-id": course_id},
+            {"$set": {"grade": new_grade}},
+        )
+        if result.matched_count == 0:
+            print(f"There is no combination of student_id {student_id} and course_id {course_id}")
+            return
+        await self._log_operation("SET", student_id, course_id, new_grade)
+
+    async def _log_operation(self, operation, student_id, course_id, new_grade='X', timestamp=None):
+        await self.oplogs.insert_one({
+            "timestamp": format_ts(timestamp or datetime.now()),
+            "operation": operation,
+            "student-id": student_id,
+            "course-id": course_id,
+            "new-grade": new_grade
+        })
+
+    async def read_set_oplogs(self):
+        return [
+            (doc['timestamp'], doc['student-id'], doc['course-id'], doc['new-grade'])
+            async for doc in self.oplogs.find({"operation": "SET"})
+        ]
+
+    async def apply_merged(self, winners):
+        # Upserts like every other store's apply_merged, each SET keeping its original timestamp
+        async with _shared_apply(self.apply_lock):
+            for (student_id, course_id), (ts, new_grade) in winners.items():
+                await self.grades.update_one(
+                    {"student-ID": student_id, "course-id": course_id},
+                    {"$set": {"grade": new_grade}},
+                    upsert=True,
+                )
+                await self._log_operation("SET", student_id, course_id, new_grade, timestamp=ts)
+
+    async def merge_from(self, *peers):
+        return await _merge_from(self, peers)
+
+    async def close(self):
+        self.client.close()
+
+
+class AsyncHiveGradeManager:
+    """Runs a HiveGradeManager's blocking cursor calls in worker threads.
+
+    pyhive has no async driver, and the wrapped manager owns a single Thrift
+    connection, so calls are serialised with a lock while the event loop stays free.
+    """
+
+    store_name = "hive"
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = asyncio.Lock()
+
+    async def _call(self, method, *args):
+        async with self.lock:
+            return await asyncio.to_thread(method, *args)
+
+    async def get(self, student_id, course_id):
+        return await self._call(self.manager.get, student_id, course_id)
+
+    async def set(self, student_id, course_id, new_grade):
+        return await self._call(self.manager.set, student_id, course_id, new_grade)
+
+    async def read_set_oplogs(self):
+        return await self._call(self.manager.read_set_oplogs)
+
+    async def apply_merged(self, winners):
+        return await self._call(self.manager.apply_merged, winners)
+
+    async def merge_from(self, *peers):
+        return await _merge_from(self, peers)
@@ -0,0 +1,127 @@
+import threading
+from oplog_merge import resolve_lww, format_ts
+
+
+def _versions(rows):
+    # Checkpoint rows as oplog-style (timestamp, student_id, course_id, grade), skipping never-written keys
+    return [(ts, student_id, course_id, grade) for student_id, course_id, grade, ts in rows if ts]
+
+
+def latest_versions(manager):
+    """(clock, {(student_id, course_id): timestamp of its last SET}) from the checkpoint plus the oplog."""
+    clock, previous = manager.load_checkpoint()
+
+    # The whole remaining oplog is read because merges can log entries older than clock
+    latest = {}
+    for ts, student_id, course_id, new_grade in _versions(previous) + manager.read_set_oplogs():
+        ts = format_ts(ts)
+        if (student_id, course_id) not in latest or ts > latest[(student_id, course_id)]:
+            latest[(student_id, course_id)] = ts
+        if clock is None or ts > clock:
+            clock = ts
+    return clock, latest
+
+
+def take_checkpoint(manager):
+    """Snapshot manager's grades tagged with its latest oplog clock position; returns the clock."""
+    clock, latest = latest_versions(manager)
+    if clock is None:
+        # Nothing has been written yet, so there is nothing to checkpoint
+        return None
+
+    rows = [
+        (student_id, course_id, grade, latest.get((student_id, course_id)))
+        for student_id, course_id, grade in manager.scan_grades()
+    ]
+    manager.save_checkpoint(clock, rows)
+    print(f"Checkpointed {len(rows)} grades in {manager.store_name.upper()} at {clock}.")
+    return clock
+
+
+def merge_incremental(target, source):
+    """Merge source into target, fetching only what target has not merged from source yet.
+
+    If source has truncated its oplog past target's position (or target has
+    never merged from it), source's checkpoint stands in for the missing prefix.
+    Entries that source itself merged in from a third store keep their original
+    timestamps and may sit behind target's position; target picks those up by
+    merging from that store directly.
+    """
+    since = target.get_merge_progress().get(source.name)
+    source_clock, source_rows = source.load_checkpoint()
+    if source_clock is not None and (since is None or since < source_clock):
+        remote = _versions(source_rows) + source.read_set_oplogs()
+    else:
+        remote = source.read_set_oplogs(since=since)
+
+    # Local state is our own checkpoint plus everything left in our oplog
+    _, local_rows = target.load_checkpoint()
+    local = _versions(local_rows) + target.read_set_oplogs()
+
+    winners = resolve_lww(remote, local)
+    target.apply_merged(winners)
+
+    merged_until = max([format_ts(row[0]) for row in remote] + [since or '', source_clock or ''])
+    if merged_until:
+        target.set_merge_progress(source.name, merged_until)
+
+    print(f"Merged {len(winners)} records into {target.store_name.upper()} from {source.store_name.upper()}.")
+    return len(winners)
+
+
+def truncate_acknowledged(manager, peers):
+    """Drop oplog entries that every peer has merged and that are covered by manager's checkpoint."""
+    # Merges and journal flushes keep their entries' original timestamps, so one applied
+    # between the checkpoint and the truncate could sit below the horizon without being
+    # in the checkpoint. Holding apply_lock exclusively keeps them out until the truncate is done.
+    with manager.apply_lock.exclusive():
+        # Checkpoint first so everything about to be dropped is covered by it
+        clock = take_checkpoint(manager)
+        if clock is None:
+            return None
+
+        horizon = clock
+        for peer in peers:
+            acked = peer.get_merge_progress().get(manager.name)
+            if acked is None:
+                # This peer has never merged from us, so everything must be kept
+                return None
+            horizon = min(horizon, acked)
+
+        manager.truncate_oplogs(horizon)
+    print(f"Truncated {manager.store_name.upper()} oplog up to {horizon}.")
+    return horizon
+
+
+def bootstrap_from(target, source):
+    """Bring a new (empty) or lagging target up from source's latest checkpoint, then replay the tail."""
+    clock, rows = source.load_checkpoint()
+    if clock is not None and not target.scan_grades():
+        target.insert_grades([(student_id, course_id, grade) for student_id, course_id, grade, _ in rows])
+        target.save_checkpoint(clock, rows)
+        target.set_merge_progress(source.name, clock)
+    return merge_incremental(target, source)
+
+
+class CheckpointDaemon(threading.Thread):
+    """Periodically checkpoints each manager and truncates what all its peers have acknowledged."""
+
+    def __init__(self, managers, interval=3600):
+        super().__init__(daemon=True)
+        self.managers = list(managers)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        for manager in self.managers:
+            try:
+                truncate_acknowledged(manager, [peer for peer in self.managers if peer is not manager])
+            except Exception as e:
+                print(f"Error checkpointing {manager.store_name.upper()}: {e}")
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,67 @@
+from oplog_merge import format_ts
+
+# Rough relative cost of applying merged keys, per target store:
+# (fixed cost per merge, cost per grade row rewritten, cost per winning key).
+# Hive rewrites the whole grades table on every apply; the others update in place.
+APPLY_COST = {
+    "sql": (1, 0, 1),
+    "mongo": (1, 0, 1),
+    "hive": (200, 1, 1),
+}
+
+
+def plan_merge(target, sources):
+    """Estimate what merging each source into target would cost, without changing anything.
+
+    Uses count/max and distinct-key counts on the oplogs only. For each source it reports
+    the rows a merge would fetch, the distinct keys among the source SETs
+    target has not merged yet as likely_winners, and an apply cost from
+    APPLY_COST. likely_winners is an upper bound: without comparing keys the
+    planner cannot tell which of those keys target already overwrote with
+    newer SETs. The recommended order merges the sources with the fewest
+    expected winners first, since every key merged in is read again as local
+    state by the merges after it.
+    """
+    local = target.oplog_stats()
+    progress = target.get_merge_progress()
+    per_merge, per_rewritten_row, per_key = APPLY_COST.get(target.store_name, (1, 0, 1))
+
+    steps = []
+    for source in sources:
+        fetched = source.oplog_stats(since=progress.get(source.name), keys=True)
+        # Upper bound; a global max timestamp in target says nothing about the keys it never wrote
+        winners = fetched["set_keys"]
+        steps.append({
+            "source": source.name,
+            "rows_to_fetch": fetched["set_rows"] + local["set_rows"],
+            "likely_winners": winners,
+            "apply_cost": per_merge + per_rewritten_row * local["grade_rows"] + per_key * winners if winners else 0,
+            "source_max_timestamp": format_ts(fetched["max_timestamp"]),
+        })
+
+    steps.sort(key=lambda step: (step["likely_winners"], step["rows_to_fetch"]))
+
+    # Each merge also re-reads the keys that earlier merges wrote into target
+    carried = 0
+    for step in steps:
+        step["rows_to_fetch"] += carried
+        carried += step["likely_winners"]
+
+    return {
+        "target": target.name,
+        "order": [step["source"] for step in steps],
+        "steps": steps,
+        "total_rows_to_fetch": sum(step["rows_to_fetch"] for step in steps),
+        "total_apply_cost": sum(step["apply_cost"] for step in steps),
+    }
+
+
+def print_plan(plan):
+    print(f"Merge plan for {plan['target'].upper()} (dry run, nothing was changed):")
+    for number, step in enumerate(plan["steps"], 1):
+        print(
+            f"  {number}. MERGE ({step['source'].upper()}): fetch ~{step['rows_to_fetch']} oplog rows, "
+            f"~{step['likely_winners']} winning keys, apply cost ~{step['apply_cost']} "
+            f"(source newest SET {step['source_max_timestamp']})"
+        )
+    print(f"  Total: ~{plan['total_rows_to_fetch']} rows fetched, apply cost ~{plan['total_apply_cost']}")
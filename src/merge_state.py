@@ -0,0 +1,126 @@
+from array import array
+from datetime import datetime, timedelta
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class MergeState:
+    """Last-writer-wins state for one merge, kept in flat arrays instead of a dict of tuples.
+
+    Student, course and grade strings are interned to integer codes, so each
+    offered oplog row costs a packed 8-byte key, an 8-byte timestamp (microseconds
+    since the epoch), a 2-byte grade code and one bit for the remote flag. Winners
+    are picked in one vectorised pass when the merge asks for them, with the same
+    result as the dict version: the newest timestamp per key wins, and on a tie
+    the row offered first wins (remote rows are offered before local ones).
+    """
+
+    __slots__ = (
+        '_student_codes', '_students',
+        '_course_codes', '_courses',
+        '_grade_codes', '_grades',
+        '_keys', '_ts', '_grade', '_remote',
+    )
+
+    def __init__(self):
+        self._student_codes = {}
+        self._students = []
+        self._course_codes = {}
+        self._courses = []
+        self._grade_codes = {}
+        self._grades = []
+
+        self._keys = array('Q')
+        self._ts = array('q')
+        self._grade = array('H')
+        self._remote = bytearray()
+
+    @staticmethod
+    def _intern(value, codes, values):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def offer(self, key, ts, grade, remote):
+        # Record one SET oplog row for key = (student_id, course_id); ts is an already parsed datetime
+        student_id, course_id = key
+        student = self._intern(student_id, self._student_codes, self._students)
+        course = self._intern(course_id, self._course_codes, self._courses)
+
+        row = len(self._ts)
+        self._keys.append(student << 32 | course)
+        self._ts.append((ts - EPOCH) // timedelta(microseconds=1))
+        self._grade.append(self._intern(grade, self._grade_codes, self._grades))
+        if row % 8 == 0:
+            self._remote.append(0)
+        if remote:
+            self._remote[row >> 3] |= 1 << (row & 7)
+
+    def __len__(self):
+        # Number of distinct keys seen so far
+        if not self._keys:
+            return 0
+        return len(np.unique(np.frombuffer(self._keys, dtype=np.uint64)))
+
+    def _winning_rows(self):
+        rows = len(self._ts)
+        keys = np.frombuffer(self._keys, dtype=np.uint64)
+        ts = np.frombuffer(self._ts, dtype=np.int64)
+
+        # Sort by key, then timestamp, then earliest offer last; the last row of each key group wins
+        order = np.lexsort((-np.arange(rows), ts, keys))
+        sorted_keys = keys[order]
+        last = np.ones(rows, dtype=bool)
+        last[:-1] = sorted_keys[1:] != sorted_keys[:-1]
+        return order[last]
+
+    def remote_winners(self):
+        """Keys whose newest write came from the remote store, as a Winners view over the winning rows."""
+        if not self._ts:
+            return Winners()
+        winners = self._winning_rows()
+        remote = np.unpackbits(np.frombuffer(self._remote, dtype=np.uint8), bitorder='little')[:len(self._ts)]
+        rows = winners[remote[winners] == 1]
+        return Winners((
+            np.frombuffer(self._keys, dtype=np.uint64)[rows],
+            np.frombuffer(self._ts, dtype=np.int64)[rows],
+            np.frombuffer(self._grade, dtype=np.uint16)[rows],
+            self._students, self._courses, self._grades,
+        ))
+
+
+class Winners:
+    """Merge winners kept as the resolved arrays and decoded only while they are read.
+
+    Behaves like the {(student_id, course_id): (ts, grade)} dict apply_merged
+    takes (len, truth value, iteration over keys, items()), but items() builds
+    the tuples a chunk at a time, so a large merge never holds a dict of every
+    winning key. Winners of disjoint slices combine with +.
+    """
+
+    __slots__ = ('_parts',)
+
+    CHUNK = 10000
+
+    def __init__(self, *parts):
+        # Each part: (packed keys, timestamps, grade codes, students, courses, grades)
+        self._parts = parts
+
+    def __len__(self):
+        return sum(len(part[0]) for part in self._parts)
+
+    def __add__(self, other):
+        return Winners(*self._parts, *other._parts)
+
+    def items(self):
+        for keys, ts, grade, students, courses, grades in self._parts:
+            for start in range(0, len(keys), self.CHUNK):
+                chunk = slice(start, start + self.CHUNK)
+                for key, micros, code in zip(keys[chunk].tolist(), ts[chunk].tolist(), grade[chunk].tolist()):
+                    yield (students[key >> 32], courses[key & 0xFFFFFFFF]), (EPOCH + timedelta(microseconds=micros), grades[code])
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
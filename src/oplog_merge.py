@@ -0,0 +1,56 @@
+from datetime import datetime
+
+
+def parse_ts(ts):
+    # Oplog timestamps are stored as strings, with or without milliseconds
+    if isinstance(ts, str):
+        try:
+            return datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+        except ValueError:
+            return datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')
+    return ts
+
+
+def format_ts(ts):
+    # Same millisecond string format that _log_operation writes, so stored timestamps compare as text
+    if isinstance(ts, datetime):
+        return ts.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    return ts
+
+
+def batched(iterable, size):
+    # Lists of up to size items, so apply_merged can write a large merge in bounded batches
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_lww(remote_rows, local_rows):
+    """Last-writer-wins over two SET oplog streams, returning the remote winners as a merge_state.Winners.
+
+    Rows are (timestamp, student_id, course_id, new_grade). Remote rows are
+    read first, so on equal timestamps the remote value wins, same as merge().
+    """
+    # numpy (behind MergeState) is only loaded when a merge runs
+    from merge_state import MergeState
+    kv_store = MergeState()
+
+    for ts, student_id, course_id, new_grade in remote_rows:
+        key = (student_id, course_id)
+        ts = parse_ts(ts)
+        # Store with remote flag
+        kv_store.offer(key, ts, new_grade, remote=True)
+
+    for ts, student_id, course_id, new_grade in local_rows:
+        key = (student_id, course_id)
+        ts = parse_ts(ts)
+        # Store with local flag
+        kv_store.offer(key, ts, new_grade, remote=False)
+
+    # Filter out local records
+    return kv_store.remote_winners()
@@ -0,0 +1,62 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+from oplog_merge import format_ts
+
+
+class ReadStatsAggregator:
+    """Counts GETs per key and time window in memory instead of logging an oplog row per read.
+
+    Counts are written to the manager's read_stats table/collection as one
+    (window_start, student_id, course_id, reads) row per key and window when
+    the window rolls over, when flush_every reads are pending, on hot_keys()
+    and at interpreter exit.
+    """
+
+    def __init__(self, manager, window=60, flush_every=1000):
+        self.manager = manager
+        self.window = window
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.pending = 0
+        self.current_window = None
+        atexit.register(self.flush)
+
+    def _window_start(self):
+        # Same millisecond format as format_ts, so read_hot_keys(since=...) compares like with like
+        now = time.time()
+        return format_ts(datetime.fromtimestamp(now - now % self.window))
+
+    def record(self, student_id, course_id, flush=True):
+        # With flush=False the caller flushes when this returns True (e.g. off an event loop)
+        window_start = self._window_start()
+        with self.lock:
+            rolled = self.current_window is not None and window_start != self.current_window
+            self.current_window = window_start
+            key = (window_start, student_id, course_id)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.pending += 1
+            due = rolled or self.pending >= self.flush_every
+        if due and flush:
+            self.flush()
+        return due
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts, self.pending = self.counts, {}, 0
+        if not counts:
+            return
+        try:
+            self.manager.write_read_stats([
+                (window_start, student_id, course_id, reads)
+                for (window_start, student_id, course_id), reads in counts.items()
+            ])
+        except Exception as e:
+            print(f"Error writing read stats to {self.manager.store_name.upper()}: {e}")
+
+    def hot_keys(self, limit=10, since=None):
+        """Most read keys as [(student_id, course_id, reads)], optionally only windows starting at/after since."""
+        self.flush()
+        return self.manager.read_hot_keys(limit, since)
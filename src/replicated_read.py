@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from oplog_merge import parse_ts
+
+# Consistency levels for replicated_get
+ONE = "ONE"
+QUORUM = "QUORUM"
+ALL = "ALL"
+
+CONSISTENCY_LEVELS = (ONE, QUORUM, ALL)
+
+
+def _required(consistency, replicas):
+    if consistency == ONE:
+        return 1
+    if consistency == QUORUM:
+        return replicas // 2 + 1
+    if consistency == ALL:
+        return replicas
+    raise ValueError(f"Unknown consistency level {consistency}, expected one of {CONSISTENCY_LEVELS}")
+
+
+def replicated_get(managers, student_id, course_id, consistency=QUORUM, read_repair=False, timeout=None):
+    """Read one grade from several stores in parallel at the given consistency level.
+
+    ONE returns whatever the fastest store answers. QUORUM and ALL wait for a
+    majority / every store, compare the timestamps of each store's last SET for
+    the key and return the newest grade; with read_repair the stale responders
+    are brought up to date through apply_merged. Slow stores that are not
+    needed are not waited for. Returns None if too few stores answered.
+    """
+    required = _required(consistency, len(managers))
+    key = (student_id, course_id)
+
+    pool = ThreadPoolExecutor(max_workers=len(managers))
+    futures = {pool.submit(manager.get_versioned, student_id, course_id): manager for manager in managers}
+    responses = []
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            manager = futures[future]
+            try:
+                grade, ts = future.result()
+            except Exception as e:
+                print(f"Error reading from {manager.store_name.upper()}: {e}")
+                continue
+            responses.append((manager, grade, parse_ts(ts) if ts else None))
+            if len(responses) >= required:
+                break
+    except TimeoutError:
+        pass
+    finally:
+        # Do not block on stores we no longer need (e.g. a slow Hive query). Hive's
+        # get_versioned holds the manager's lock, so the next command waits for it
+        pool.shutdown(wait=False)
+
+    if len(responses) < required:
+        print(f"Only {len(responses)} of {required} stores answered for {key} at {consistency}.")
+        return None
+
+    if consistency == ONE:
+        return responses[0][1]
+
+    # Newest write wins; stores that never had a SET for the key rank oldest
+    _, grade, ts = max(responses, key=lambda response: response[2] or datetime.min)
+
+    if read_repair and ts is not None:
+        for manager, stale_grade, stale_ts in responses:
+            if stale_ts is None or stale_ts < ts or stale_grade != grade:
+                try:
+                    manager.apply_merged({key: (ts, grade)})
+                    print(f"Read-repaired {key} in {manager.store_name.upper()} to {grade}.")
+                except Exception as e:
+                    print(f"Error read-repairing {manager.store_name.upper()}: {e}")
+
+    return grade
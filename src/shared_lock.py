@@ -0,0 +1,61 @@
+import threading
+from contextlib import contextmanager
+
+
+class SharedLock:
+    """Lock with a shared mode for concurrent holders and an exclusive mode for one.
+
+    Each manager's apply_lock: apply_merged holds it shared, so parallel slice
+    applies still run side by side, and checkpoints.truncate_acknowledged holds
+    it exclusive. A waiting exclusive holder blocks new shared holders, so a
+    steady stream of applies cannot starve it. Not reentrant; the acquire and
+    release calls are not tied to a thread, so async managers can acquire in a
+    worker thread and release on the event loop.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.shared_holders = 0
+        self.exclusive_held = False
+        self.exclusive_waiting = 0
+
+    def acquire_shared(self):
+        with self.condition:
+            while self.exclusive_held or self.exclusive_waiting:
+                self.condition.wait()
+            self.shared_holders += 1
+
+    def release_shared(self):
+        with self.condition:
+            self.shared_holders -= 1
+            if not self.shared_holders:
+                self.condition.notify_all()
+
+    def acquire_exclusive(self):
+        with self.condition:
+            self.exclusive_waiting += 1
+            while self.exclusive_held or self.shared_holders:
+                self.condition.wait()
+            self.exclusive_waiting -= 1
+            self.exclusive_held = True
+
+    def release_exclusive(self):
+        with self.condition:
+            self.exclusive_held = False
+            self.condition.notify_all()
+
+    @contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield
+        finally:
+            self.release_shared()
+
+    @contextmanager
+    def exclusive(self):
+        self.acquire_exclusive()
+        try:
+            yield
+        finally:
+            self.release_exclusive()
@@ -0,0 +1,77 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+from oplog_merge import format_ts
+
+# Plain column names so Hive can read the files natively. log_timestamp is the
+# key's last SET (null if never written); importers keep it as their checkpoint.
+SCHEMA = pa.schema([
+    ('student_id', pa.string()),
+    ('course_id', pa.string()),
+    ('grade', pa.string()),
+    ('log_timestamp', pa.string()),
+])
+
+
+def export_snapshot(manager, path, row_group_size=100000, compression='snappy', version='1.0'):
+    """Stream manager's grades into a compressed Parquet file, one row group per batch.
+
+    The file metadata records the source store and its clock watermark, so an
+    importing replica only needs to merge oplog entries newer than that.
+    Snappy and format 1.0 are the defaults because stock Hive readers handle them.
+    """
+    # The store joins each key's last SET onto its grade, so no per-key map is built here.
+    # Every SET and checkpoint row belongs to a key with a grade, so the newest of those
+    # is the store's watermark; it goes into the footer once the rows are written.
+    watermark = None
+    rows = 0
+    with pq.ParquetWriter(path, SCHEMA.with_metadata({b'store': manager.name.encode()}),
+                          compression=compression, version=version) as writer:
+        for batch in manager.iter_grades(row_group_size, versions=True):
+            student_ids, course_ids, grades, timestamps = zip(*batch)
+            writer.write_table(pa.table([student_ids, course_ids, grades, timestamps], schema=SCHEMA))
+            newest = max((format_ts(ts) for ts in timestamps if ts), default=None)
+            if newest and (watermark is None or newest > watermark):
+                watermark = newest
+            rows += len(batch)
+        writer.add_key_value_metadata({b'watermark': (watermark or '').encode()})
+    print(f"Exported {rows} grades from {manager.store_name.upper()} to {path} at {watermark}.")
+    return watermark
+
+
+def read_snapshot_metadata(path):
+    # The watermark is written to the footer after the rows, so read the file metadata, not the schema's
+    metadata = pq.read_metadata(path).metadata or {}
+    return metadata.get(b'store', b'').decode(), metadata.get(b'watermark', b'').decode() or None
+
+
+def import_snapshot(manager, path, batch_size=100000):
+    """Load a snapshot into an empty store row group by row group and record its watermark.
+
+    The per-key timestamps become the store's checkpoint, as in bootstrap_from,
+    so older entries merged in later lose to the imported versions. The
+    watermark is stored as merge progress from the source store, so the next
+    merge_incremental from it only replays the oplog tail.
+    """
+    if manager.oplog_stats()["grade_rows"]:
+        print(f"{manager.store_name.upper()} already has grades; snapshots can only seed an empty store.")
+        return None
+
+    store, watermark = read_snapshot_metadata(path)
+    checkpoint = []
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        columns = batch.to_pydict()
+        grades = list(zip(columns['student_id'], columns['course_id'], columns['grade']))
+        manager.insert_grades(grades)
+        timestamps = columns.get('log_timestamp') or [None] * len(grades)
+        checkpoint.extend(grade + (ts,) for grade, ts in zip(grades, timestamps))
+
+    if watermark:
+        manager.save_checkpoint(watermark, checkpoint)
+    record_import(manager, store, watermark)
+    print(f"Imported {len(checkpoint)} grades into {manager.store_name.upper()} from {path}.")
+    return watermark
+
+
+def record_import(manager, store, watermark):
+    if store and watermark:
+        manager.set_merge_progress(store, watermark)
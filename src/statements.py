@@ -0,0 +1,140 @@
+from functools import lru_cache
+from analytics import GRADE_POINTS
+
+# Statement texts shared by the managers. Hive statements use pyhive's pyformat
+# parameters: the text is the same on every call and pyhive escapes each bound
+# value, so quotes in IDs or grades can no longer break a query.
+
+HIVE_GET_GRADE = """
+    SELECT grade FROM new_database.grades
+    WHERE `student-ID` = %(student_id)s
+      AND `course-id` = %(course_id)s
+"""
+
+HIVE_SET_GRADE = """
+    INSERT OVERWRITE TABLE new_database.grades
+    SELECT `student-ID`, `course-id`, roll_no, email_ID,
+        CASE WHEN `student-ID` = %(student_id)s AND `course-id` = %(course_id)s
+                THEN %(new_grade)s
+                ELSE grade
+        END as grade
+    FROM new_database.grades
+"""
+
+HIVE_INSERT_OPLOG = """
+    INSERT INTO TABLE new_database.oplogs
+    VALUES (%(timestamp)s, %(operation)s, %(student_id)s, %(course_id)s, %(new_grade)s)
+"""
+
+HIVE_SET_OPLOGS = """
+    SELECT log_timestamp, `student-ID`, `course-id`, new_grade
+    FROM new_database.oplogs
+    WHERE operation = 'SET'
+"""
+
+HIVE_LAST_SET_TIMESTAMP = """
+    SELECT MAX(log_timestamp) FROM new_database.oplogs
+    WHERE operation = 'SET'
+      AND `student-ID` = %(student_id)s
+      AND `course-id` = %(course_id)s
+"""
+
+HIVE_CHECKPOINT_TIMESTAMP = """
+    SELECT log_timestamp FROM new_database.checkpoints
+    WHERE `student-ID` = %(student_id)s
+      AND `course-id` = %(course_id)s
+"""
+
+HIVE_SET_MERGE_PROGRESS = """
+    INSERT INTO TABLE new_database.merge_progress
+    VALUES (%(peer)s, %(merged_until)s)
+"""
+
+HIVE_TRUNCATE_OPLOGS = """
+    INSERT OVERWRITE TABLE new_database.oplogs
+    SELECT * FROM new_database.oplogs
+    WHERE log_timestamp > %(until)s
+"""
+
+# Every grade with its key's last SET over the oplog and the checkpoint (NULL if never written)
+HIVE_GRADE_VERSIONS = """
+    SELECT g.`student-ID`, g.`course-id`, g.grade, v.log_timestamp
+    FROM new_database.grades g
+    LEFT JOIN (
+        SELECT `student-ID`, `course-id`, MAX(log_timestamp) AS log_timestamp FROM (
+            SELECT `student-ID`, `course-id`, log_timestamp FROM new_database.oplogs
+            WHERE operation = 'SET'
+            UNION ALL
+            SELECT `student-ID`, `course-id`, log_timestamp FROM new_database.checkpoints
+        ) writes
+        GROUP BY `student-ID`, `course-id`
+    ) v
+    ON g.`student-ID` = v.`student-ID` AND g.`course-id` = v.`course-id`
+"""
+
+HIVE_OPLOG_STATS = """
+    SELECT COUNT(*), MAX(log_timestamp) FROM new_database.oplogs
+    WHERE operation = 'SET'
+"""
+
+# Distinct keys among the SET entries after since; a NULL since counts them all
+HIVE_OPLOG_KEYS = """
+    SELECT COUNT(*) FROM (
+        SELECT DISTINCT `student-ID`, `course-id` FROM new_database.oplogs
+        WHERE operation = 'SET'
+          AND (%(since)s IS NULL OR log_timestamp > %(since)s)
+    ) touched
+"""
+
+# Grade reports (see analytics.py). A NULL key matches every course or student.
+HIVE_POINTS = "CASE grade " + " ".join(f"WHEN '{grade}' THEN {points}" for grade, points in GRADE_POINTS.items()) + " END"
+
+HIVE_REPORTS = {
+    "distribution": """
+        SELECT `course-id`, grade, COUNT(*) FROM new_database.grades
+        WHERE %(key)s IS NULL OR `course-id` = %(key)s
+        GROUP BY `course-id`, grade
+        ORDER BY `course-id`, grade
+    """,
+    "gpa": f"""
+        SELECT `student-ID`, AVG({HIVE_POINTS}), COUNT({HIVE_POINTS}) FROM new_database.grades
+        WHERE %(key)s IS NULL OR `student-ID` = %(key)s
+        GROUP BY `student-ID`
+        ORDER BY `student-ID`
+    """,
+    "counts": """
+        SELECT grade, COUNT(*) FROM new_database.grades
+        WHERE %(key)s IS NULL OR `course-id` = %(key)s
+        GROUP BY grade
+        ORDER BY grade
+    """,
+}
+
+# Same SET oplog query, read by the other stores' merge() from Postgres
+SQL_SET_OPLOGS = """
+    SELECT timestamp as timestamp,
+        "student-ID" as student_id,
+        "course-id" as course_id,
+        new_grade as new_grade
+    FROM oplogs
+    WHERE operation = 'SET'
+"""
+
+
+@lru_cache(maxsize=None)
+def sql_set_oplogs():
+    # Built once per process instead of on every merge
+    from sqlalchemy import text
+    return text(SQL_SET_OPLOGS)
+
+
+@lru_cache(maxsize=256)
+def placeholders(rows, width):
+    # "(%s, %s, ...),\n(...)" for a multi-row VALUES or CASE list; cached per shape
+    row = "(" + ", ".join(["%s"] * width) + ")"
+    return ",\n".join([row] * rows)
+
+
+def flatten(rows):
+    # Positional parameters for placeholders()
+    return tuple(value for row in rows for value in row)
@@ -0,0 +1,246 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+# Tracing is off unless enable() is called. Until then instrumented classes keep
+# their original methods, so the hooks cost nothing in normal runs.
+
+enabled = False
+_events = []
+_events_lock = threading.Lock()
+_registered = []
+_pid = os.getpid()
+
+
+def _now_us():
+    return time.perf_counter_ns() / 1000
+
+
+def _record(name, start_us, duration_us, args):
+    event = {
+        "name": name,
+        "ph": "X",
+        "ts": start_us,
+        "dur": duration_us,
+        "pid": _pid,
+        "tid": threading.get_ident(),
+        "args": args,
+    }
+    with _events_lock:
+        _events.append(event)
+
+
+def _rows(result):
+    # Row count for span args, where the result has one
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    return None
+
+
+class Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = repr(exc)
+        _record(self.name, self.start, _now_us() - self.start, self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def set(self, **args):
+        pass
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(name, **args):
+    """Timed span around a block; a shared no-op object when tracing is off."""
+    if not enabled:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+def _traced(name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with Span(name, {}) as current:
+            result = method(*args, **kwargs)
+            rows = _rows(result)
+            if rows is not None:
+                current.set(rows=rows)
+            return result
+    wrapper.__traced__ = method
+    return wrapper
+
+
+def instrumented(prefix, *methods):
+    """Class decorator naming the methods that get spans (as "<prefix>.<method>") once tracing is enabled."""
+    def decorate(cls):
+        _registered.append((cls, prefix, methods))
+        if enabled:
+            _instrument(cls, prefix, methods)
+        if _profiler is not None:
+            _profile(cls)
+        return cls
+    return decorate
+
+
+def _instrument(cls, prefix, methods):
+    for name in methods:
+        method = cls.__dict__.get(name)
+        if method is not None and not hasattr(method, '__traced__'):
+            setattr(cls, name, _traced(f"{prefix}.{name}", method))
+
+
+def _install_driver_hooks():
+    # Statement-level spans from the drivers themselves, for drivers that are installed
+    try:
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+    except ImportError:
+        pass
+    else:
+        @event.listens_for(Engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('trace_start', []).append(_now_us())
+
+        @event.listens_for(Engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start = conn.info['trace_start'].pop()
+            _record("sql.execute", start, _now_us() - start, {
+                "statement": statement.split()[0].upper() if statement.strip() else "",
+                "rows": cursor.rowcount,
+            })
+
+    try:
+        from pymongo import monitoring
+    except ImportError:
+        pass
+    else:
+        class CommandTracer(monitoring.CommandListener):
+            def started(self, event):
+                pass
+
+            def succeeded(self, event):
+                reply = event.reply
+                rows = reply.get("n")
+                if rows is None and "cursor" in reply:
+                    rows = len(reply["cursor"].get("firstBatch", reply["cursor"].get("nextBatch", [])))
+                duration = event.duration_micros
+                _record(f"mongo.{event.command_name}", _now_us() - duration, duration, {"rows": rows})
+
+            def failed(self, event):
+                duration = event.duration_micros
+                _record(f"mongo.{event.command_name}", _now_us() - duration, duration, {"error": str(event.failure)})
+
+        # Only applies to clients created after this point
+        monitoring.register(CommandTracer())
+
+    try:
+        from pyhive import hive
+    except ImportError:
+        pass
+    else:
+        # pyhive has no event API; wrapping Cursor.execute also covers the ad-hoc
+        # connections the merge() readers open, and shows Hive job startup time
+        execute = hive.Cursor.execute
+        if not hasattr(execute, '__traced__'):
+            @functools.wraps(execute)
+            def traced_execute(cursor, operation, parameters=None, **kwargs):
+                start = _now_us()
+                args = {"statement": operation.split()[0].upper() if operation.strip() else ""}
+                try:
+                    return execute(cursor, operation, parameters, **kwargs)
+                except Exception as e:
+                    args["error"] = repr(e)
+                    raise
+                finally:
+                    _record("hive.cursor.execute", start, _now_us() - start, args)
+            traced_execute.__traced__ = execute
+            hive.Cursor.execute = traced_execute
+
+
+def enable():
+    """Turn tracing on: wrap every registered method and hook the SQLAlchemy/pymongo drivers."""
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    for cls, prefix, methods in _registered:
+        _instrument(cls, prefix, methods)
+    _install_driver_hooks()
+
+
+def write_chrome_trace(path):
+    """Write the recorded spans as Chrome trace-event JSON (chrome://tracing, Perfetto)."""
+    with _events_lock:
+        events = list(_events)
+    with open(path, 'w') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    print(f"Wrote {len(events)} trace events to {path}.")
+
+
+_profiler = None
+_profile_methods = ('merge', 'merge_from', 'apply_merged')
+_profile_depth = threading.local()
+
+
+def _profiled(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        # Only the outermost merge call toggles the profiler
+        depth = getattr(_profile_depth, 'value', 0)
+        _profile_depth.value = depth + 1
+        if depth == 0:
+            _profiler.enable()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _profile_depth.value = depth
+            if depth == 0:
+                _profiler.disable()
+    wrapper.__profiled__ = method
+    return wrapper
+
+
+def _profile(cls):
+    for name in _profile_methods:
+        method = cls.__dict__.get(name)
+        if method is not None and not hasattr(method, '__profiled__'):
+            setattr(cls, name, _profiled(method))
+
+
+def profile_merges(path):
+    """cProfile the merge methods of every instrumented class and dump the stats to path at exit."""
+    global _profiler
+    if _profiler is not None:
+        return
+    _profiler = cProfile.Profile()
+    for cls, _, _ in _registered:
+        _profile(cls)
+    atexit.register(lambda: (_profiler.dump_stats(path), print(f"Wrote merge profile to {path}.")))
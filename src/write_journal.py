@@ -0,0 +1,165 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from oplog_merge import format_ts, resolve_lww
+
+# Header: magic, version, flushed offset, end offset
+HEADER = struct.Struct('<4sIQQ')
+# Record: payload length, crc32 of payload
+RECORD = struct.Struct('<II')
+MAGIC = b'GJNL'
+SEPARATOR = '\x1f'
+
+
+class WriteBehindJournal:
+    """Memory-mapped SET journal that acknowledges writes at once and drains them to a manager in batches.
+
+    Records between the flushed and end offsets in the header are pending.
+    A record only counts once the end offset is moved past it, so a torn
+    append is never replayed; the pages belong to the kernel, so a crashed
+    process loses nothing, and sync=True also msyncs every append to survive
+    power loss. On open, pending records from a previous run are flushed first.
+    Each flush keeps only the last write per key, drops writes that lost to a
+    newer SET already in the store (e.g. from a merge or read repair) or that
+    name a key the store does not have, and hands the rest to
+    manager.apply_merged, so every write keeps the timestamp it was acknowledged at.
+    """
+
+    def __init__(self, path, manager, capacity=16 * 1024 * 1024, interval=1.0, batch_size=1000, sync=False):
+        self.manager = manager
+        self.interval = interval
+        self.batch_size = batch_size
+        self.sync = sync
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = 0
+
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER.size
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self.file.truncate(capacity)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+        magic, _, self.flushed, self.end = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.flushed = self.end = HEADER.size
+            self._write_header()
+        else:
+            self.pending = len(self._read_records(self.flushed, self.end)[0])
+            if self.pending:
+                print(f"Replaying {self.pending} unflushed journal entries.")
+                self.flush()
+
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+        self.flusher = threading.Thread(target=self._run, daemon=True)
+        self.flusher.start()
+
+    def _write_header(self):
+        HEADER.pack_into(self.mm, 0, MAGIC, 1, self.flushed, self.end)
+
+    def _read_records(self, start, end):
+        records = []
+        offset = start
+        while offset + RECORD.size <= end:
+            length, crc = RECORD.unpack_from(self.mm, offset)
+            payload = self.mm[offset + RECORD.size:offset + RECORD.size + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                print(f"Corrupt journal record at offset {offset}, ignoring the rest.")
+                break
+            records.append(payload.decode().split(SEPARATOR))
+            offset += RECORD.size + length
+        return records, offset
+
+    def _ensure_room(self, size):
+        # Grow the file; data never moves here, so a flush in progress is unaffected
+        if self.end + size > len(self.mm):
+            capacity = max(len(self.mm) * 2, self.end + size)
+            self.mm.close()
+            self.file.truncate(capacity)
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+
+    def _compact(self):
+        # Slide the pending region to the front of the file
+        pending = self.mm[self.flushed:self.end]
+        self.mm[HEADER.size:HEADER.size + len(pending)] = pending
+        self.flushed, self.end = HEADER.size, HEADER.size + len(pending)
+
+    def append(self, student_id, course_id, new_grade):
+        timestamp = format_ts(datetime.now())
+        payload = SEPARATOR.join((timestamp, student_id, course_id, str(new_grade))).encode()
+        record = RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self.lock:
+            self._ensure_room(len(record))
+            self.mm[self.end:self.end + len(record)] = record
+            self.end += len(record)
+            self._write_header()
+            if self.sync:
+                self.mm.flush()
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.wakeup.set()
+        return timestamp
+
+    def flush(self):
+        """Drain pending records to the manager; returns the number of keys written."""
+        with self.flush_lock:
+            with self.lock:
+                records, end = self._read_records(self.flushed, self.end)
+                count = len(records)
+            if not records:
+                return 0
+
+            # Coalesce: the last write per key within the batch wins
+            latest = {}
+            for timestamp, student_id, course_id, new_grade in records:
+                latest[(student_id, course_id)] = (timestamp, new_grade)
+            batch = [(timestamp, student_id, course_id, new_grade)
+                     for (student_id, course_id), (timestamp, new_grade) in latest.items()]
+
+            # Only SETs logged after the oldest journalled write can beat it
+            since = min(timestamp for timestamp, _, _, _ in batch)
+            resolved = resolve_lww(batch, self.manager.read_set_oplogs(since=since))
+            existing = self.manager.existing_keys(list(resolved))
+            winners = {key: version for key, version in resolved.items() if key in existing}
+            unknown = [key for key in resolved if key not in existing]
+            if unknown:
+                print(f"Rejected journalled SETs for {len(unknown)} unknown keys: {unknown[:10]}")
+            if winners:
+                self.manager.apply_merged(winners)
+
+            with self.lock:
+                self.flushed = end
+                self.pending -= count
+                if self.flushed == self.end:
+                    # Everything is flushed, so reuse the file from the start
+                    self.flushed = self.end = HEADER.size
+                elif self.flushed > len(self.mm) // 2:
+                    self._compact()
+                self._write_header()
+                self.mm.flush()
+
+        print(f"Flushed {count} journalled SETs as {len(winners)} writes to {self.manager.store_name.upper()}.")
+        return len(winners)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Records stay in the journal and are retried on the next round
+                print(f"Error flushing journal: {e}")
+
+    def close(self):
+        self.stopped.set()
+        self.wakeup.set()
+        self.flusher.join()
+        self.flush()
+        self.mm.close()
+        self.file.close()